@@ -7,30 +7,108 @@ Course: Introduction to Cryptology
 Date: 2025
 """
 
-import time
-import statistics
+import argparse
+import collections
+import contextlib
+import functools
+import gc
+import hmac
+import json
+import os
+import timeit
 import random
 import string
 
+import numpy as np
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:  # numba is optional and only used when requested
+    NUMBA_AVAILABLE = False
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:  # orjson is optional; fall back to the json module
+    ORJSON_AVAILABLE = False
+
+# Where the demo writes its results for visualization.py to pick up
+OUTPUT_DIR = 'outputs'
+RESULTS_JSON = 'results_data.json'
+SAMPLES_NPZ = 'results_samples.npz'
+
+# Calls timed together in each sample; every stored sample is the per-call
+# mean over one batch, so spreads describe batch means, not single calls
+BATCH_SIZE = 100
+
+# Characters used for generated passwords and wrong guesses
+PASSWORD_CHARS = tuple(string.ascii_letters + string.digits)
+
+# Seeded generator so the password and attempts are reproducible across runs
+DEFAULT_SEED = 0xC0FFEE
+_RNG = random.Random(DEFAULT_SEED)
+
+
+def _vulnerable_kernel(input_bytes, correct_bytes):
+    """
+    Byte-by-byte comparison that returns at the first mismatch.
+    Runs as plain Python by default; see _compiled_vulnerable_kernel.
+    """
+    # Check length first
+    if len(input_bytes) != len(correct_bytes):
+        return False
+    
+    # Compare byte by byte - STOPS at first mismatch
+    for i in range(len(correct_bytes)):
+        if input_bytes[i] != correct_bytes[i]:
+            return False  # TIMING LEAK: Returns immediately!
+    
+    return True
+
+
+@functools.lru_cache(maxsize=None)
+def _compiled_vulnerable_kernel():
+    """
+    Return _vulnerable_kernel compiled with numba, compiling it on first use.
+    
+    Opt-in only: for short passwords numba's call dispatch and bytes
+    unboxing cost far more than the compiled byte compares, which hides
+    the early-exit leak the demo is meant to show.
+    """
+    if not NUMBA_AVAILABLE:
+        raise ImportError("numba is not installed")
+    return njit(cache=True)(_vulnerable_kernel)
+
+
 class PasswordChecker:
     """
     A class to demonstrate vulnerable and secure password checking methods.
     """
     
-    def __init__(self, correct_password):
+    def __init__(self, correct_password, use_numba=False):
         """
         Initialize with a correct password to check against.
         
         Args:
             correct_password (str): The secret password to protect
+            use_numba (bool): Run vulnerable_check's loop as numba-compiled
+                code instead of plain Python
         """
         self.correct_password = correct_password
+        # Both checks compare bytes; encode the secret once up front
+        self._pw = correct_password.encode('utf-8')
+        self._vulnerable_kernel = (_compiled_vulnerable_kernel() if use_numba
+                                   else _vulnerable_kernel)
     
     def vulnerable_check(self, input_password):
         """
         VULNERABLE: Character-by-character comparison with early exit.
         This implementation is vulnerable to timing attacks because it returns
-        immediately when it finds the first incorrect character.
+        immediately when it finds the first incorrect character. The loop is
+        written out byte by byte so each extra correct character adds a
+        measurable amount of time; built-in == also exits early, but on short
+        inputs it finishes too quickly for this demo to resolve the leak.
         
         Args:
             input_password (str): Password attempt to verify
@@ -38,22 +116,14 @@ class PasswordChecker:
         Returns:
             bool: True if password matches, False otherwise
         """
-        # Check length first
-        if len(input_password) != len(self.correct_password):
-            return False
-        
-        # Compare character by character - STOPS at first mismatch
-        for i in range(len(self.correct_password)):
-            if input_password[i] != self.correct_password[i]:
-                return False  # TIMING LEAK: Returns immediately!
-        
-        return True
+        return self._vulnerable_kernel(input_password.encode('utf-8'), self._pw)
     
     def secure_check(self, input_password):
         """
         SECURE: Constant-time comparison that always checks all characters.
-        This implementation is resistant to timing attacks because it always
-        takes the same amount of time regardless of input.
+        Delegates to hmac.compare_digest, the standard library's constant-time
+        comparison, so the running time does not depend on where the first
+        mismatch occurs.
         
         Args:
             input_password (str): Password attempt to verify
@@ -61,42 +131,75 @@ class PasswordChecker:
         Returns:
             bool: True if password matches, False otherwise
         """
-        # Normalize length to prevent length-based timing leaks
-        if len(input_password) != len(self.correct_password):
-            # Pad to correct length to maintain constant time
-            input_password = input_password.ljust(len(self.correct_password), '\0')
-        
-        # Use bitwise OR to accumulate differences without early exit
-        result = 0
-        for i in range(len(self.correct_password)):
-            # XOR reveals differences, OR accumulates them
-            result |= ord(input_password[i]) ^ ord(self.correct_password[i])
+        # hmac.compare_digest is implemented in C and never exits early;
+        # only a length mismatch is revealed by its running time
+        return hmac.compare_digest(input_password.encode('utf-8'), self._pw)
+    
+    def _baseline_check(self, input_password):
+        """
+        Everything the checks do except the comparison: a bound method call
+        and encoding the attempt. Timed to calibrate away harness overhead.
         
-        # Always completes all comparisons before returning
-        return result == 0
+        Args:
+            input_password (str): Password attempt to encode
+        """
+        input_password.encode('utf-8')
 
 
-def measure_execution_time(func, *args, iterations=1000):
+@contextlib.contextmanager
+def _pinned_to_one_cpu():
+    """
+    Pin the process to a single CPU for the duration of the block, where the
+    platform supports it, so a measurement is not split across cores.
+    """
+    if not hasattr(os, 'sched_setaffinity'):
+        yield
+        return
+    
+    allowed = os.sched_getaffinity(0)
+    os.sched_setaffinity(0, {min(allowed)})
+    try:
+        yield
+    finally:
+        os.sched_setaffinity(0, allowed)
+
+
+def measure_execution_time(func, *args, iterations=1000, inner=BATCH_SIZE):
     """
     Measure the average execution time of a function over multiple iterations.
     
+    Each sample times a batch of ``inner`` back-to-back calls with a single
+    pair of clock reads, so the clock overhead is spread over the batch
+    instead of dominating a call that only takes a few nanoseconds. Garbage
+    collection is disabled and, on Linux, the process is pinned to one CPU
+    while sampling to cut down on jitter.
+    
     Args:
         func: Function to measure
         *args: Arguments to pass to the function
-        iterations (int): Number of times to run the function
+        iterations (int): Number of samples to collect
+        inner (int): Number of calls timed together in each sample
         
     Returns:
-        tuple: (average_time, all_times) in nanoseconds
+        tuple: (average_time, all_times) in nanoseconds per call, with
+            all_times as a float32 array of per-batch means
     """
-    times = []
-    
-    for _ in range(iterations):
-        start = time.perf_counter_ns()
-        func(*args)
-        end = time.perf_counter_ns()
-        times.append(end - start)
-    
-    avg_time = statistics.mean(times)
+    timer = timeit.Timer(functools.partial(func, *args))
+    
+    times = np.empty(iterations, dtype=np.float32)
+    
+    # Collect pending garbage up front and keep the collector off for the
+    # whole run so no GC pause lands inside a sample
+    gc.collect()
+    gc.disable()
+    try:
+        with _pinned_to_one_cpu():
+            times[:] = timer.repeat(repeat=iterations, number=inner)
+    finally:
+        gc.enable()
+    times *= 1e9 / inner
+    
+    avg_time = float(times.mean(dtype=np.float64))
     return avg_time, times
 
 
@@ -114,34 +217,33 @@ def generate_password_attempts(correct_password, num_correct_chars):
     if num_correct_chars >= len(correct_password):
         return correct_password
     
-    # Take correct characters from the beginning
-    attempt = correct_password[:num_correct_chars]
+    # Draw all the wrong characters in one call
+    wrong = _RNG.choices(PASSWORD_CHARS, k=len(correct_password) - num_correct_chars)
     
-    # Fill rest with random characters (but different from correct ones)
-    for i in range(num_correct_chars, len(correct_password)):
-        # Get a random character that's different from the correct one
-        chars = string.ascii_letters + string.digits
-        random_char = random.choice(chars)
-        while random_char == correct_password[i]:
-            random_char = random.choice(chars)
-        attempt += random_char
+    # Replace any that happen to match the correct character at that position
+    for j, correct_char in enumerate(correct_password[num_correct_chars:]):
+        while wrong[j] == correct_char:
+            wrong[j] = _RNG.choice(PASSWORD_CHARS)
     
-    return attempt
+    # Take correct characters from the beginning
+    return correct_password[:num_correct_chars] + ''.join(wrong)
 
 
-def timing_attack_simulation(password_length=8):
+def timing_attack_simulation(password_length=8, use_numba=False):
     """
     Simulate a timing attack by measuring response times for different inputs.
+    Reported times have the cost of calling a check and encoding the attempt
+    subtracted.
     
     Args:
         password_length (int): Length of the password to test
+        use_numba (bool): Compile the vulnerable comparison loop with numba
         
     Returns:
         dict: Results containing timing data for vulnerable and secure implementations
     """
     # Generate a random password
-    correct_password = ''.join(random.choices(string.ascii_letters + string.digits, 
-                                             k=password_length))
+    correct_password = ''.join(_RNG.choices(PASSWORD_CHARS, k=password_length))
     
     print(f"\n{'='*70}")
     print(f"TIMING ATTACK SIMULATION")
@@ -150,7 +252,11 @@ def timing_attack_simulation(password_length=8):
     print(f"Correct Password (for demonstration): {correct_password}")
     print(f"{'='*70}\n")
     
-    checker = PasswordChecker(correct_password)
+    checker = PasswordChecker(correct_password, use_numba=use_numba)
+    
+    # Build each attempt once and reuse it for both implementations
+    attempts = [generate_password_attempts(correct_password, num_correct)
+                for num_correct in range(password_length + 1)]
     
     results = {
         'vulnerable': {},
@@ -158,101 +264,145 @@ def timing_attack_simulation(password_length=8):
         'password_length': password_length
     }
     
-    # Test with different numbers of correct characters
-    print("Testing VULNERABLE implementation (early exit)...")
-    print(f"{'Correct Chars':<15} {'Avg Time (ns)':<20} {'Std Dev (ns)':<20}")
-    print(f"{'-'*55}")
+    # Warm up so JIT compilation is not included in the first measurement
+    checker.vulnerable_check(attempts[0])
+    
+    # Calibrate: time a bound method that only encodes the attempt and
+    # subtract it from every measurement, leaving mostly the comparison;
+    # the checks' attribute lookups and inner call are not covered. The
+    # median ignores the occasional batch stalled for tens of microseconds.
+    _, baseline_samples = measure_execution_time(checker._baseline_check, attempts[0],
+                                                 iterations=5000)
+    baseline_time = float(np.median(baseline_samples))
+    results['baseline_time'] = baseline_time
+    print(f"Measurement baseline (call + encode): {baseline_time:.2f} ns\n")
+    
+    # Test both implementations on the same attempt in a single pass
+    print("Testing VULNERABLE (early exit) and SECURE (constant-time) implementations...")
+    print(f"Times are per-call means over batches of {BATCH_SIZE} calls; "
+          f"Batch SD is the spread of those batch means.\n")
+    print(f"{'Correct Chars':<15} {'Vulnerable (ns)':<20} {'Batch SD (ns)':<16} "
+          f"{'Secure (ns)':<20} {'Batch SD (ns)':<16}")
+    print(f"{'-'*87}")
     
     for num_correct in range(password_length + 1):
-        attempt = generate_password_attempts(correct_password, num_correct)
-        avg_time, all_times = measure_execution_time(
-            checker.vulnerable_check, 
-            attempt, 
-            iterations=1000
-        )
-        std_dev = statistics.stdev(all_times)
-        
-        results['vulnerable'][num_correct] = {
-            'avg_time': avg_time,
-            'std_dev': std_dev,
-            'all_times': all_times
-        }
+        attempt = attempts[num_correct]
+        row = f"{num_correct:<15}"
         
-        print(f"{num_correct:<15} {avg_time:<20.2f} {std_dev:<20.2f}")
-    
-    print(f"\n{'-'*55}\n")
-    
-    # Test secure implementation
-    print("Testing SECURE implementation (constant-time)...")
-    print(f"{'Correct Chars':<15} {'Avg Time (ns)':<20} {'Std Dev (ns)':<20}")
-    print(f"{'-'*55}")
-    
-    for num_correct in range(password_length + 1):
-        attempt = generate_password_attempts(correct_password, num_correct)
-        avg_time, all_times = measure_execution_time(
-            checker.secure_check, 
-            attempt, 
-            iterations=1000
-        )
-        std_dev = statistics.stdev(all_times)
-        
-        results['secure'][num_correct] = {
-            'avg_time': avg_time,
-            'std_dev': std_dev,
-            'all_times': all_times
-        }
+        for impl, check in (('vulnerable', checker.vulnerable_check),
+                            ('secure', checker.secure_check)):
+            avg_time, all_times = measure_execution_time(
+                check, 
+                attempt, 
+                iterations=1000
+            )
+            avg_time -= baseline_time
+            all_times -= baseline_time
+            std_dev = float(all_times.std(dtype=np.float64, ddof=1))
+            
+            results[impl][num_correct] = {
+                'avg_time': avg_time,
+                'std_dev': std_dev,
+                'all_times': all_times
+            }
+            
+            row += f" {avg_time:<20.2f} {std_dev:<16.2f}"
         
-        print(f"{num_correct:<15} {avg_time:<20.2f} {std_dev:<20.2f}")
+        print(row)
     
     print(f"\n{'='*70}\n")
     
     return results, correct_password
 
 
-def analyze_results(results):
+# Results reshaped into arrays ordered by number of correct characters;
+# the *_all fields hold one row of samples per number of correct characters
+FlatResults = collections.namedtuple('FlatResults', [
+    'num_chars', 'vuln_avg', 'vuln_std', 'secure_avg', 'secure_std',
+    'vuln_all', 'secure_all'
+])
+
+
+def flatten_results(results):
+    """
+    Convert the nested results dict into arrays, once, for analysis and plotting.
+    
+    Args:
+        results (dict): Results from timing_attack_simulation
+        
+    Returns:
+        FlatResults: Per-implementation averages, standard deviations and samples
+    """
+    num_chars = np.array(sorted(results['vulnerable'].keys()))
+    vuln = [results['vulnerable'][i] for i in num_chars]
+    secure = [results['secure'][i] for i in num_chars]
+    
+    return FlatResults(
+        num_chars=num_chars,
+        vuln_avg=np.array([cell['avg_time'] for cell in vuln]),
+        vuln_std=np.array([cell['std_dev'] for cell in vuln]),
+        secure_avg=np.array([cell['avg_time'] for cell in secure]),
+        secure_std=np.array([cell['std_dev'] for cell in secure]),
+        vuln_all=np.stack([cell['all_times'] for cell in vuln]),
+        secure_all=np.stack([cell['all_times'] for cell in secure])
+    )
+
+
+def analyze_results(results, flat=None):
     """
     Analyze the timing attack results and print insights.
     
     Args:
         results (dict): Results from timing_attack_simulation
+        flat (FlatResults, optional): results already passed through
+            flatten_results; flattened here if omitted
     """
+    if flat is None:
+        flat = flatten_results(results)
+    
     print(f"\n{'='*70}")
     print(f"ANALYSIS: Timing Attack Vulnerability")
     print(f"{'='*70}\n")
     
+    # Percentages are relative to the full call time (baseline added back);
+    # the baseline-subtracted times alone can be close to zero
+    baseline_time = results.get('baseline_time', 0.0)
+    
     # Analyze vulnerable implementation
-    vuln_times = [results['vulnerable'][i]['avg_time'] 
-                  for i in sorted(results['vulnerable'].keys())]
+    vuln_times = flat.vuln_avg
+    vuln_raw_fastest = vuln_times[0] + baseline_time
     
     time_increase = vuln_times[-1] - vuln_times[0]
-    correlation = statistics.correlation(
-        list(range(len(vuln_times))), 
+    correlation = float(np.corrcoef(
+        np.arange(len(vuln_times)), 
         vuln_times
-    ) if len(vuln_times) > 1 else 0
+    )[0, 1]) if len(vuln_times) > 1 else 0
     
     print("VULNERABLE Implementation:")
     print(f"  - Fastest response (0 correct): {vuln_times[0]:.2f} ns")
     print(f"  - Slowest response (all correct): {vuln_times[-1]:.2f} ns")
-    print(f"  - Time increase: {time_increase:.2f} ns ({time_increase/vuln_times[0]*100:.1f}%)")
+    print(f"  - Time increase: {time_increase:.2f} ns "
+          f"({time_increase/vuln_raw_fastest*100:.1f}% of the 0-correct call, baseline included)")
     print(f"  - Correlation coefficient: {correlation:.4f}")
     print(f"  - VERDICT: {'VULNERABLE' if correlation > 0.8 else 'POSSIBLY VULNERABLE'} to timing attacks")
     
     print()
     
     # Analyze secure implementation
-    secure_times = [results['secure'][i]['avg_time'] 
-                    for i in sorted(results['secure'].keys())]
+    secure_times = flat.secure_avg
+    secure_raw_min = min(secure_times) + baseline_time
     
     time_variance = max(secure_times) - min(secure_times)
-    secure_correlation = statistics.correlation(
-        list(range(len(secure_times))), 
+    secure_correlation = float(np.corrcoef(
+        np.arange(len(secure_times)), 
         secure_times
-    ) if len(secure_times) > 1 else 0
+    )[0, 1]) if len(secure_times) > 1 else 0
     
     print("SECURE Implementation:")
     print(f"  - Min response time: {min(secure_times):.2f} ns")
     print(f"  - Max response time: {max(secure_times):.2f} ns")
-    print(f"  - Time variance: {time_variance:.2f} ns ({time_variance/min(secure_times)*100:.1f}%)")
+    print(f"  - Time variance: {time_variance:.2f} ns "
+          f"({time_variance/secure_raw_min*100:.1f}% of the fastest call, baseline included)")
     print(f"  - Correlation coefficient: {secure_correlation:.4f}")
     print(f"  - VERDICT: {'SECURE' if abs(secure_correlation) < 0.3 else 'POSSIBLY VULNERABLE'}")
     
@@ -261,12 +411,142 @@ def analyze_results(results):
     return {
         'vulnerable_correlation': correlation,
         'secure_correlation': secure_correlation,
-        'time_increase_percentage': time_increase/vuln_times[0]*100,
-        'secure_variance_percentage': time_variance/min(secure_times)*100
+        'time_increase_percentage': float(time_increase/vuln_raw_fastest*100),
+        'secure_variance_percentage': float(time_variance/secure_raw_min*100)
     }
 
 
+def _dump_json(payload, path):
+    """
+    Write payload as indented JSON, using orjson when it is installed.
+    
+    Args:
+        payload (dict): Data to write; may contain NumPy arrays
+        path (str): File to write
+    """
+    if ORJSON_AVAILABLE:
+        with open(path, 'wb') as f:
+            f.write(orjson.dumps(payload, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+    else:
+        with open(path, 'w') as f:
+            json.dump(payload, f, indent=2, default=np.ndarray.tolist)
+
+
+def _load_json(path):
+    """
+    Read a JSON file, using orjson when it is installed.
+    
+    Args:
+        path (str): File to read
+        
+    Returns:
+        dict: Parsed data
+    """
+    if ORJSON_AVAILABLE:
+        with open(path, 'rb') as f:
+            return orjson.loads(f.read())
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_results(results, analysis, output_dir=OUTPUT_DIR, flat=None):
+    """
+    Save simulation results so the graphs can be drawn without re-running it.
+    
+    Summary statistics and the analysis go to a JSON file, one array per
+    statistic ordered by num_chars; the raw timing samples go to a
+    compressed .npz archive next to it.
+    
+    Args:
+        results (dict): Results from timing_attack_simulation
+        analysis (dict): Analysis results from analyze_results
+        output_dir (str): Directory to write the files to
+        flat (FlatResults, optional): results already passed through
+            flatten_results; flattened here if omitted
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    
+    if flat is None:
+        flat = flatten_results(results)
+    summary = {'num_chars': flat.num_chars}
+    for impl, avg, std, samples in (('vulnerable', flat.vuln_avg, flat.vuln_std, flat.vuln_all),
+                                    ('secure', flat.secure_avg, flat.secure_std, flat.secure_all)):
+        # Quartiles summarise the samples without writing every one
+        q_min, q1, median, q3, q_max = np.percentile(samples, [0, 25, 50, 75, 100], axis=1)
+        summary[impl] = {
+            'avg_time': avg,
+            'std_dev': std,
+            'min': q_min,
+            'q1': q1,
+            'median': median,
+            'q3': q3,
+            'max': q_max
+        }
+    
+    _dump_json({
+        'results': summary,
+        'analysis': analysis,
+        'password_length': results['password_length'],
+        'baseline_time': results['baseline_time']
+    }, os.path.join(output_dir, RESULTS_JSON))
+    
+    np.savez_compressed(os.path.join(output_dir, SAMPLES_NPZ),
+                        vulnerable=flat.vuln_all, secure=flat.secure_all)
+
+
+def load_results(output_dir=OUTPUT_DIR):
+    """
+    Load results previously written by save_results.
+    
+    Args:
+        output_dir (str): Directory the files were written to
+        
+    Returns:
+        tuple: (results, analysis), or None if the files are missing or
+            were written in an older format
+    """
+    json_path = os.path.join(output_dir, RESULTS_JSON)
+    samples_path = os.path.join(output_dir, SAMPLES_NPZ)
+    if not (os.path.exists(json_path) and os.path.exists(samples_path)):
+        return None
+    
+    data = _load_json(json_path)
+    summary = data['results']
+    if 'num_chars' not in summary:
+        return None
+    
+    results = {
+        'password_length': data['password_length'],
+        'baseline_time': data['baseline_time']
+    }
+    with np.load(samples_path) as samples:
+        for impl in ['vulnerable', 'secure']:
+            all_times = samples[impl]
+            results[impl] = {
+                num_correct: {
+                    'avg_time': summary[impl]['avg_time'][row],
+                    'std_dev': summary[impl]['std_dev'][row],
+                    'all_times': all_times[row]
+                }
+                for row, num_correct in enumerate(summary['num_chars'])
+            }
+    
+    return results, data['analysis']
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED,
+                        help='seed for the password and attempt generator '
+                             f'(default: {DEFAULT_SEED:#x})')
+    parser.add_argument('--numba', action='store_true',
+                        help='compile the vulnerable comparison loop with numba '
+                             '(its call overhead can hide the leak)')
+    args = parser.parse_args()
+    if args.numba and not NUMBA_AVAILABLE:
+        parser.error("--numba requires numba to be installed")
+    _RNG.seed(args.seed)
+    
     print("""
     ╔════════════════════════════════════════════════════════════════════╗
     ║                                                                    ║
@@ -279,10 +559,19 @@ if __name__ == "__main__":
     """)
     
     # Run simulation with 8-character password
-    results, correct_pwd = timing_attack_simulation(password_length=8)
+    results, correct_pwd = timing_attack_simulation(password_length=8,
+                                                    use_numba=args.numba)
+    
+    # Flatten once for both the analysis and the saved files
+    flat = flatten_results(results)
     
     # Analyze results
-    analysis = analyze_results(results)
+    analysis = analyze_results(results, flat=flat)
+    
+    # Save results for visualization.py
+    save_results(results, analysis, flat=flat)
+    print(f"✓ Saved: {os.path.join(OUTPUT_DIR, RESULTS_JSON)}")
+    print(f"✓ Saved: {os.path.join(OUTPUT_DIR, SAMPLES_NPZ)}")
     
     print("\nSimulation completed successfully!")
     print("Run 'python visualization.py' to generate graphs of the results.")
@@ -5,23 +5,31 @@ Generates graphs and charts to illustrate timing attack vulnerabilities.
 FIXED VERSION - Works on Windows/Mac/Linux without absolute paths
 """
 
-import matplotlib.pyplot as plt
 import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend
+matplotlib.use('Agg')  # Use non-interactive backend; must precede pyplot
+import matplotlib.pyplot as plt
 import numpy as np
-from timing_attack_demo import timing_attack_simulation, analyze_results
-import json
+from timing_attack_demo import (timing_attack_simulation, analyze_results,
+                                flatten_results, save_results, load_results,
+                                BATCH_SIZE)
+import argparse
+import multiprocessing
 import os
 
-# Set style for professional-looking plots
-plt.style.use('seaborn-v0_8-darkgrid')
-plt.rcParams['figure.figsize'] = (12, 8)
-plt.rcParams['font.size'] = 10
-plt.rcParams['axes.labelsize'] = 12
-plt.rcParams['axes.titlesize'] = 14
-plt.rcParams['xtick.labelsize'] = 10
-plt.rcParams['ytick.labelsize'] = 10
-plt.rcParams['legend.fontsize'] = 10
+# Style for professional-looking plots, applied only while plotting so
+# importing this module leaves the global matplotlib settings untouched
+PLOT_STYLE = [
+    'seaborn-v0_8-darkgrid',
+    {
+        'figure.figsize': (12, 8),
+        'font.size': 10,
+        'axes.labelsize': 12,
+        'axes.titlesize': 14,
+        'xtick.labelsize': 10,
+        'ytick.labelsize': 10,
+        'legend.fontsize': 10,
+    },
+]
 
 # Create outputs directory if it doesn't exist
 OUTPUT_DIR = 'outputs'
@@ -29,117 +37,179 @@ if not os.path.exists(OUTPUT_DIR):
     os.makedirs(OUTPUT_DIR)
     print(f"✓ Created '{OUTPUT_DIR}' directory")
 
+# Every sample is the per-call mean of one timed batch of calls
+TIME_LABEL = f'Time per Call (ns, mean of {BATCH_SIZE}-call batch)'
+
+# Two-panel figure shared by the side-by-side plots; created on first use
+_PANEL_FIG = None
+
+
+def get_panel_axes():
+    """
+    Return the shared two-panel figure with both axes cleared for reuse.
+    
+    Returns:
+        tuple: (fig, (ax1, ax2))
+    """
+    global _PANEL_FIG
+    if _PANEL_FIG is None:
+        _PANEL_FIG, _ = plt.subplots(1, 2, figsize=(16, 6), constrained_layout=True)
+    ax1, ax2 = _PANEL_FIG.axes
+    ax1.clear()
+    ax2.clear()
+    return _PANEL_FIG, (ax1, ax2)
+
+
+def save_figure(fig, filename):
+    """
+    Save a figure to OUTPUT_DIR as a PNG.
+    
+    Layout is handled by constrained_layout when the figure is created, so
+    the image is rendered once; fast zlib settings trade a little file size
+    for quicker writes.
+    
+    Args:
+        fig: Figure to save
+        filename (str): File name inside OUTPUT_DIR
+    """
+    fig.savefig(os.path.join(OUTPUT_DIR, filename), dpi=150,
+                pil_kwargs={'optimize': False, 'compress_level': 1})
+    print(f"✓ Saved: {filename}")
+
+
+def close_panel_figure():
+    """
+    Close the shared two-panel figure once all plots have been saved.
+    """
+    global _PANEL_FIG
+    if _PANEL_FIG is not None:
+        plt.close(_PANEL_FIG)
+        _PANEL_FIG = None
+
+
+def linfit(x, y):
+    """
+    Closed-form least-squares straight line through (x, y).
+    
+    Args:
+        x: x values
+        y: y values
+        
+    Returns:
+        tuple: (slope, intercept)
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    x_mean = x.mean()
+    y_mean = y.mean()
+    slope = ((x - x_mean) * (y - y_mean)).sum() / ((x - x_mean) ** 2).sum()
+    return slope, y_mean - slope * x_mean
+
 
-def create_comparison_plot(results):
+def create_comparison_plot(flat):
     """
     Create a comparison plot showing timing differences between vulnerable and secure implementations.
     
     Args:
-        results (dict): Results from timing_attack_simulation
+        flat (FlatResults): Results from timing_attack_simulation, flattened
     """
-    num_chars = sorted(results['vulnerable'].keys())
+    num_chars = flat.num_chars
     
-    vuln_times = [results['vulnerable'][i]['avg_time'] for i in num_chars]
-    secure_times = [results['secure'][i]['avg_time'] for i in num_chars]
+    vuln_times = flat.vuln_avg
+    secure_times = flat.secure_avg
     
-    vuln_std = [results['vulnerable'][i]['std_dev'] for i in num_chars]
-    secure_std = [results['secure'][i]['std_dev'] for i in num_chars]
+    vuln_std = flat.vuln_std
+    secure_std = flat.secure_std
     
-    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 6))
+    fig, (ax1, ax2) = get_panel_axes()
     
     # Plot 1: Vulnerable Implementation
     ax1.errorbar(num_chars, vuln_times, yerr=vuln_std, 
                 marker='o', linewidth=2, markersize=8, 
-                color='#e74c3c', capsize=5, label='Average Time')
+                color='#e74c3c', capsize=5, label='Average Time (±1 SD of batch means)')
     ax1.set_xlabel('Number of Correct Characters', fontweight='bold')
-    ax1.set_ylabel('Execution Time (nanoseconds)', fontweight='bold')
+    ax1.set_ylabel(TIME_LABEL, fontweight='bold')
     ax1.set_title('VULNERABLE Implementation\n(Character-by-Character with Early Exit)', 
                  fontweight='bold', color='#e74c3c')
     ax1.grid(True, alpha=0.3)
     ax1.legend()
     
     # Add trend line
-    z = np.polyfit(num_chars, vuln_times, 1)
-    p = np.poly1d(z)
-    ax1.plot(num_chars, p(num_chars), "--", color='#c0392b', 
-            alpha=0.8, linewidth=2, label=f'Trend (slope={z[0]:.2f})')
+    slope, intercept = linfit(num_chars, vuln_times)
+    ax1.plot(num_chars, slope * num_chars + intercept, "--", color='#c0392b', 
+            alpha=0.8, linewidth=2, label=f'Trend (slope={slope:.2f})')
     ax1.legend()
     
     # Plot 2: Secure Implementation
     ax2.errorbar(num_chars, secure_times, yerr=secure_std,
                 marker='s', linewidth=2, markersize=8,
-                color='#27ae60', capsize=5, label='Average Time')
+                color='#27ae60', capsize=5, label='Average Time (±1 SD of batch means)')
     ax2.set_xlabel('Number of Correct Characters', fontweight='bold')
-    ax2.set_ylabel('Execution Time (nanoseconds)', fontweight='bold')
+    ax2.set_ylabel(TIME_LABEL, fontweight='bold')
     ax2.set_title('SECURE Implementation\n(Constant-Time Comparison)', 
                  fontweight='bold', color='#27ae60')
     ax2.grid(True, alpha=0.3)
     ax2.legend()
     
     # Add trend line
-    z2 = np.polyfit(num_chars, secure_times, 1)
-    p2 = np.poly1d(z2)
-    ax2.plot(num_chars, p2(num_chars), "--", color='#229954',
-            alpha=0.8, linewidth=2, label=f'Trend (slope={z2[0]:.2f})')
+    slope2, intercept2 = linfit(num_chars, secure_times)
+    ax2.plot(num_chars, slope2 * num_chars + intercept2, "--", color='#229954',
+            alpha=0.8, linewidth=2, label=f'Trend (slope={slope2:.2f})')
     ax2.legend()
     
-    plt.tight_layout()
-    plt.savefig(os.path.join(OUTPUT_DIR, 'timing_comparison.png'), dpi=300, bbox_inches='tight')
-    print("✓ Saved: timing_comparison.png")
-    plt.close()
+    save_figure(fig, 'timing_comparison.png')
 
 
-def create_overlay_plot(results):
+def create_overlay_plot(flat):
     """
     Create an overlay plot comparing both implementations directly.
     
     Args:
-        results (dict): Results from timing_attack_simulation
+        flat (FlatResults): Results from timing_attack_simulation, flattened
     """
-    num_chars = sorted(results['vulnerable'].keys())
+    num_chars = flat.num_chars
     
-    vuln_times = [results['vulnerable'][i]['avg_time'] for i in num_chars]
-    secure_times = [results['secure'][i]['avg_time'] for i in num_chars]
+    vuln_times = flat.vuln_avg
+    secure_times = flat.secure_avg
     
-    plt.figure(figsize=(14, 8))
+    fig, ax = plt.subplots(figsize=(14, 8), constrained_layout=True)
     
-    plt.plot(num_chars, vuln_times, marker='o', linewidth=3, 
+    ax.plot(num_chars, vuln_times, marker='o', linewidth=3, 
             markersize=10, color='#e74c3c', label='Vulnerable (Early Exit)', 
             alpha=0.8)
-    plt.plot(num_chars, secure_times, marker='s', linewidth=3,
+    ax.plot(num_chars, secure_times, marker='s', linewidth=3,
             markersize=10, color='#27ae60', label='Secure (Constant-Time)',
             alpha=0.8)
     
-    plt.xlabel('Number of Correct Characters', fontweight='bold', fontsize=14)
-    plt.ylabel('Average Execution Time (nanoseconds)', fontweight='bold', fontsize=14)
-    plt.title('Timing Attack Vulnerability Comparison\nVulnerable vs. Secure Implementation', 
+    ax.set_xlabel('Number of Correct Characters', fontweight='bold', fontsize=14)
+    ax.set_ylabel('Average Time per Call (nanoseconds)', fontweight='bold', fontsize=14)
+    ax.set_title('Timing Attack Vulnerability Comparison\nVulnerable vs. Secure Implementation', 
              fontweight='bold', fontsize=16)
-    plt.legend(fontsize=12, loc='best')
-    plt.grid(True, alpha=0.3)
+    ax.legend(fontsize=12, loc='best')
+    ax.grid(True, alpha=0.3)
     
     # Add shaded region to show vulnerability
-    plt.fill_between(num_chars, vuln_times, secure_times, 
+    ax.fill_between(num_chars, vuln_times, secure_times, 
                     alpha=0.2, color='yellow',
                     label='Timing Leak Zone')
     
-    plt.tight_layout()
-    plt.savefig(os.path.join(OUTPUT_DIR, 'overlay_comparison.png'), dpi=300, bbox_inches='tight')
-    print("✓ Saved: overlay_comparison.png")
-    plt.close()
+    save_figure(fig, 'overlay_comparison.png')
+    plt.close(fig)
 
 
-def create_distribution_plot(results):
+def create_distribution_plot(flat):
     """
     Create box plots showing time distribution for different numbers of correct characters.
     
     Args:
-        results (dict): Results from timing_attack_simulation
+        flat (FlatResults): Results from timing_attack_simulation, flattened
     """
-    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 6))
+    fig, (ax1, ax2) = get_panel_axes()
     
-    # Vulnerable implementation distribution
-    vuln_data = [results['vulnerable'][i]['all_times'] for i in sorted(results['vulnerable'].keys())]
-    positions = sorted(results['vulnerable'].keys())
+    # Vulnerable implementation distribution; boxplot draws one box per
+    # column, so transpose the one-row-per-position sample arrays
+    vuln_data = flat.vuln_all.T
+    positions = flat.num_chars
     
     bp1 = ax1.boxplot(vuln_data, positions=positions, widths=0.6,
                      patch_artist=True, showmeans=True,
@@ -148,13 +218,13 @@ def create_distribution_plot(results):
                      meanprops=dict(marker='D', markerfacecolor='#c0392b', markersize=6))
     
     ax1.set_xlabel('Number of Correct Characters', fontweight='bold')
-    ax1.set_ylabel('Execution Time (nanoseconds)', fontweight='bold')
-    ax1.set_title('VULNERABLE Implementation - Time Distribution', 
+    ax1.set_ylabel(TIME_LABEL, fontweight='bold')
+    ax1.set_title('VULNERABLE Implementation - Distribution of Batch Means', 
                  fontweight='bold', color='#e74c3c')
     ax1.grid(True, alpha=0.3, axis='y')
     
     # Secure implementation distribution
-    secure_data = [results['secure'][i]['all_times'] for i in sorted(results['secure'].keys())]
+    secure_data = flat.secure_all.T
     
     bp2 = ax2.boxplot(secure_data, positions=positions, widths=0.6,
                      patch_artist=True, showmeans=True,
@@ -163,68 +233,59 @@ def create_distribution_plot(results):
                      meanprops=dict(marker='D', markerfacecolor='#229954', markersize=6))
     
     ax2.set_xlabel('Number of Correct Characters', fontweight='bold')
-    ax2.set_ylabel('Execution Time (nanoseconds)', fontweight='bold')
-    ax2.set_title('SECURE Implementation - Time Distribution', 
+    ax2.set_ylabel(TIME_LABEL, fontweight='bold')
+    ax2.set_title('SECURE Implementation - Distribution of Batch Means', 
                  fontweight='bold', color='#27ae60')
     ax2.grid(True, alpha=0.3, axis='y')
     
-    plt.tight_layout()
-    plt.savefig(os.path.join(OUTPUT_DIR, 'distribution_plot.png'), dpi=300, bbox_inches='tight')
-    print("✓ Saved: distribution_plot.png")
-    plt.close()
+    save_figure(fig, 'distribution_plot.png')
 
 
-def create_correlation_plot(results):
+def create_correlation_plot(flat):
     """
     Create a scatter plot showing correlation between correct characters and timing.
     
     Args:
-        results (dict): Results from timing_attack_simulation
+        flat (FlatResults): Results from timing_attack_simulation, flattened
     """
-    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 6))
+    fig, (ax1, ax2) = get_panel_axes()
+    
+    num_chars = flat.num_chars
     
-    num_chars = sorted(results['vulnerable'].keys())
+    # x position of every sample, matching the row-major order of *_all
+    x = np.repeat(num_chars, flat.vuln_all.shape[1])
     
     # Vulnerable - scatter all measurements
-    for i in num_chars:
-        times = results['vulnerable'][i]['all_times']
-        x = [i] * len(times)
-        ax1.scatter(x, times, alpha=0.3, s=10, color='#e74c3c')
+    ax1.scatter(x, flat.vuln_all.ravel(), alpha=0.3, s=10, color='#e74c3c')
     
     # Add average line
-    vuln_avgs = [results['vulnerable'][i]['avg_time'] for i in num_chars]
+    vuln_avgs = flat.vuln_avg
     ax1.plot(num_chars, vuln_avgs, 'o-', color='#c0392b', 
             linewidth=3, markersize=10, label='Average', zorder=5)
     
     ax1.set_xlabel('Number of Correct Characters', fontweight='bold')
-    ax1.set_ylabel('Execution Time (nanoseconds)', fontweight='bold')
+    ax1.set_ylabel(TIME_LABEL, fontweight='bold')
     ax1.set_title('VULNERABLE - Correlation Analysis\n(High Correlation = Information Leak)', 
                  fontweight='bold', color='#e74c3c')
     ax1.legend()
     ax1.grid(True, alpha=0.3)
     
     # Secure - scatter all measurements
-    for i in num_chars:
-        times = results['secure'][i]['all_times']
-        x = [i] * len(times)
-        ax2.scatter(x, times, alpha=0.3, s=10, color='#27ae60')
+    ax2.scatter(x, flat.secure_all.ravel(), alpha=0.3, s=10, color='#27ae60')
     
     # Add average line
-    secure_avgs = [results['secure'][i]['avg_time'] for i in num_chars]
+    secure_avgs = flat.secure_avg
     ax2.plot(num_chars, secure_avgs, 's-', color='#229954',
             linewidth=3, markersize=10, label='Average', zorder=5)
     
     ax2.set_xlabel('Number of Correct Characters', fontweight='bold')
-    ax2.set_ylabel('Execution Time (nanoseconds)', fontweight='bold')
+    ax2.set_ylabel(TIME_LABEL, fontweight='bold')
     ax2.set_title('SECURE - Correlation Analysis\n(Low Correlation = No Information Leak)', 
                  fontweight='bold', color='#27ae60')
     ax2.legend()
     ax2.grid(True, alpha=0.3)
     
-    plt.tight_layout()
-    plt.savefig(os.path.join(OUTPUT_DIR, 'correlation_analysis.png'), dpi=300, bbox_inches='tight')
-    print("✓ Saved: correlation_analysis.png")
-    plt.close()
+    save_figure(fig, 'correlation_analysis.png')
 
 
 def create_summary_chart(analysis):
@@ -234,7 +295,7 @@ def create_summary_chart(analysis):
     Args:
         analysis (dict): Analysis results from analyze_results
     """
-    fig, ax = plt.subplots(figsize=(12, 8))
+    fig, ax = plt.subplots(figsize=(12, 8), constrained_layout=True)
     
     metrics = ['Correlation\nCoefficient', 'Time Increase/\nVariance (%)']
     vulnerable_values = [
@@ -270,57 +331,102 @@ def create_summary_chart(analysis):
                    f'{height:.2f}',
                    ha='center', va='bottom', fontsize=10, fontweight='bold')
     
-    plt.tight_layout()
-    plt.savefig(os.path.join(OUTPUT_DIR, 'metrics_summary.png'), dpi=300, bbox_inches='tight')
-    print("✓ Saved: metrics_summary.png")
-    plt.close()
+    save_figure(fig, 'metrics_summary.png')
+    plt.close(fig)
 
 
-def generate_all_visualizations():
+# Plot functions by name; create_summary_chart is drawn from the analysis,
+# the rest from the flattened results
+PLOT_FUNCTIONS = {
+    'comparison': create_comparison_plot,
+    'overlay': create_overlay_plot,
+    'distribution': create_distribution_plot,
+    'correlation': create_correlation_plot,
+    'summary': create_summary_chart,
+}
+
+# Plots grouped into independent tasks; the two-panel plots share a task so
+# they reuse the same panel figure
+PLOT_TASKS = [
+    ('comparison', 'distribution', 'correlation'),
+    ('overlay',),
+    ('summary',),
+]
+
+
+def _plot_worker(names, flat, analysis):
+    """
+    Draw and save a group of plots; runs in a worker process when plotting
+    in parallel.
+    
+    Args:
+        names (tuple): Keys into PLOT_FUNCTIONS
+        flat (FlatResults): Results from timing_attack_simulation, flattened
+        analysis (dict): Analysis results from analyze_results
+    """
+    with plt.style.context(PLOT_STYLE):
+        for name in names:
+            if name == 'summary':
+                PLOT_FUNCTIONS[name](analysis)
+            else:
+                PLOT_FUNCTIONS[name](flat)
+        close_panel_figure()
+
+
+def generate_all_visualizations(results=None, analysis=None, force=False):
     """
     Main function to run simulation and generate all visualizations.
+    
+    Args:
+        results (dict, optional): Results from timing_attack_simulation.
+            When omitted, results saved by timing_attack_demo.py are loaded,
+            and the simulation is only run if none are found.
+        analysis (dict, optional): Analysis results from analyze_results
+        force (bool): Re-run the simulation even if saved results exist
     """
     print("\n" + "="*70)
     print("GENERATING VISUALIZATIONS")
     print("="*70 + "\n")
     
+    # Reuse the results saved by timing_attack_demo.py when available
+    if results is None and not force:
+        loaded = load_results(OUTPUT_DIR)
+        if loaded is not None:
+            print("Loading saved simulation results...")
+            results, analysis = loaded
+    
     # Run simulation
-    print("Running timing attack simulation...")
-    results, correct_pwd = timing_attack_simulation(password_length=8)
+    if results is None:
+        print("Running timing attack simulation...")
+        results, correct_pwd = timing_attack_simulation(password_length=8)
+        analysis = None
+    
+    # Flatten once; the analysis, saved files and every plot read the same arrays
+    flat = flatten_results(results)
     
     # Analyze results
-    print("\nAnalyzing results...")
-    analysis = analyze_results(results)
-    
-    # Save raw results to JSON
-    results_serializable = {}
-    for impl in ['vulnerable', 'secure']:
-        results_serializable[impl] = {}
-        for key, value in results[impl].items():
-            results_serializable[impl][key] = {
-                'avg_time': value['avg_time'],
-                'std_dev': value['std_dev']
-            }
-    
-    json_path = os.path.join(OUTPUT_DIR, 'results_data.json')
-    with open(json_path, 'w') as f:
-        json.dump({
-            'results': results_serializable,
-            'analysis': analysis,
-            'password_length': results['password_length']
-        }, f, indent=2)
-    
-    print(f"\n✓ Saved: results_data.json\n")
+    if analysis is None:
+        print("\nAnalyzing results...")
+        analysis = analyze_results(results, flat=flat)
+        
+        # Save results so the next run can skip the simulation
+        save_results(results, analysis, OUTPUT_DIR, flat=flat)
+        print(f"\n✓ Saved: results_data.json, results_samples.npz\n")
     
     # Create all plots
     print("Generating plots...")
     print("-" * 70)
     
-    create_comparison_plot(results)
-    create_overlay_plot(results)
-    create_distribution_plot(results)
-    create_correlation_plot(results)
-    create_summary_chart(analysis)
+    # The tasks are independent, so render them concurrently when there is
+    # more than one CPU; otherwise a pool only adds start-up and pickling
+    tasks = [(names, flat, analysis) for names in PLOT_TASKS]
+    processes = min(len(tasks), os.cpu_count() or 1)
+    if processes == 1:
+        for task in tasks:
+            _plot_worker(*task)
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            pool.starmap(_plot_worker, tasks)
     
     print("-" * 70)
     print("\n" + "="*70)
@@ -333,9 +439,15 @@ def generate_all_visualizations():
     print("  3. distribution_plot.png - Box plots showing distributions")
     print("  4. correlation_analysis.png - Scatter plots with correlation")
     print("  5. metrics_summary.png - Bar chart of key metrics")
-    print("  6. results_data.json - Raw numerical data")
+    print("  6. results_data.json - Summary statistics and analysis")
+    print("  7. results_samples.npz - Raw timing samples")
     print("\n" + "="*70 + "\n")
 
 
 if __name__ == "__main__":
-    generate_all_visualizations()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--force', action='store_true',
+                        help='re-run the simulation even if saved results exist')
+    args = parser.parse_args()
+    
+    generate_all_visualizations(force=args.force)